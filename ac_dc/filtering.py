@@ -1,12 +1,5 @@
-import re
-
 import numpy as np
 
-import fasttext
-
-import sentencepiece
-import kenlm
-
 import pathlib
 
 from languages_id import langs_id
@@ -53,6 +46,8 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "fasttext_id"
         ].iloc[0]
         if fasttext_lang_id:
+            import fasttext
+
             model_lang_id = fasttext.load_model(path_fasttext_model)
         else:
             model_lang_id = None
@@ -64,6 +59,8 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "sentencepiece_id"
         ].iloc[0]
         if sentencepiece_lang_id:
+            import sentencepiece
+
             sentencepiece_model = sentencepiece.SentencePieceProcessor()
             sentencepiece_model.load(path_sentencepiece_model)
         else:
@@ -76,6 +73,8 @@ class LoadParameters:
             langs_id["dataset_id"] == lang_dataset_id, "kenlm_id"
         ].iloc[0]
         if kenlm_lang_id:
+            import kenlm
+
             kenlm_model = kenlm.Model(path_kenlm_model)
         else:
             kenlm_model = None
@@ -93,27 +92,10 @@ class ModifyingDocuments:
 
     @staticmethod
     def uniform_whitespace(
-        document,
-        whitespace=[
-            " ",
-            " ",
-            " ",
-            " ",
-            " ",
-            "　",
-            " ",
-            " ",
-            " ",
-            " ",
-            "￼",
-            "",
-        ],
+        document, whitespace_table=normalization["whitespace_table"]
     ):
         """There are different whitespace characters."""
-        whitespace = set(whitespace)
-        document = "".join(
-            [char if char not in whitespace else " " for char in document]
-        )
+        document = document.translate(whitespace_table)
         return document
 
     @staticmethod
@@ -121,8 +103,8 @@ class ModifyingDocuments:
         return digits_re.sub("0", document)
 
     @staticmethod
-    def replace_unicode_punctuation(document, unicode_punctuation):
-        return "".join(unicode_punctuation.get(c, c) for c in document)
+    def replace_unicode_punctuation(document, unicode_punctuation_table):
+        return document.translate(unicode_punctuation_table)
 
     @staticmethod
     def normalization(
@@ -135,7 +117,8 @@ class ModifyingDocuments:
         replace_unicode_punctuation,
         non_printing_characters_re=normalization["non_printing_characters_re"],
         digits_re=normalization["digits_re"],
-        unicode_punctuation=normalization["unicode_punctuation"],
+        whitespace_table=normalization["whitespace_table"],
+        unicode_punctuation_table=normalization["unicode_punctuation_table"],
     ):
         if remove_non_printing_characters:
             document = ModifyingDocuments.remove_non_printing_characters(
@@ -148,12 +131,12 @@ class ModifyingDocuments:
         if lower_case:
             document = document.lower()
         if uniform_whitespace:
-            document = ModifyingDocuments.uniform_whitespace(document)
+            document = ModifyingDocuments.uniform_whitespace(document, whitespace_table)
         if replace_digits_with_zeros:
             document = ModifyingDocuments.replace_digits_with_zeros(document, digits_re)
         if replace_unicode_punctuation:
             document = ModifyingDocuments.replace_unicode_punctuation(
-                document, unicode_punctuation
+                document, unicode_punctuation_table
             )
         return document
 
@@ -171,9 +154,11 @@ class ModifyingDocuments:
         tab=False,
     ):
         """This method also removes concatenated spaces."""
-        sep = [" "] + new_line * ["\n"] + tab * ["\t"]
-        sep = "|".join(sep)
-        split_document = re.split(sep, document)
+        if new_line:
+            document = document.replace("\n", " ")
+        if tab:
+            document = document.replace("\t", " ")
+        split_document = document.split(" ")
         split_document = ModifyingDocuments.remove_empty_el_from_list(split_document)
         return split_document
 
@@ -382,8 +367,12 @@ class FunctionDatasetModifyingDocuments:
         self.param = LoadParameters.load_parameters(lang_dataset_id)
 
     def __call__(self, example):
-        example["text"] = ModifyingDocuments.modifying_documents(
-            document=example["text"],
+        example["text"] = self.modifying_document(example["text"])
+        return example
+
+    def modifying_document(self, document):
+        document = ModifyingDocuments.modifying_documents(
+            document=document,
             cond_uniform_whitespace=self.param["cond_uniform_whitespace"],
             cond_replace_unicode_punctuation=self.param[
                 "cond_replace_unicode_punctuation"
@@ -396,7 +385,7 @@ class FunctionDatasetModifyingDocuments:
             cond_remove_long_words=self.param["cond_remove_long_words"],
             length_word_max_cutoff=self.param["length_word_max_cutoff"],
         )
-        return example
+        return document
 
     def __reduce__(self):
         return (self.__class__, (self.lang_dataset_id,))
@@ -650,11 +639,8 @@ class Filtering:
         return cond
 
     @staticmethod
-    def compute_lang_id_pred_score(document, model_lang_id):
-        document = document.lower().replace("\n", " ")
-        pred = model_lang_id.predict(document)
-        lang_pred_fasttext_id = pred[0][0].replace("__label__", "")
-        score_pred = pred[1][0]
+    def get_lang_pred_dataset_id(lang_pred_fasttext_label):
+        lang_pred_fasttext_id = lang_pred_fasttext_label.replace("__label__", "")
         lang_pred_dataset_id = langs_id.loc[
             langs_id["fasttext_id"] == lang_pred_fasttext_id, "dataset_id"
         ]
@@ -662,20 +648,50 @@ class Filtering:
             lang_pred_dataset_id = lang_pred_dataset_id.iloc[0]
         else:
             lang_pred_dataset_id = "unknown"
+        return lang_pred_dataset_id
+
+    @staticmethod
+    def compute_lang_id_pred_score(document, model_lang_id):
+        document = document.lower().replace("\n", " ")
+        pred = model_lang_id.predict(document)
+        lang_pred_dataset_id = Filtering.get_lang_pred_dataset_id(pred[0][0])
+        score_pred = pred[1][0]
         return lang_pred_dataset_id, score_pred
 
+    @staticmethod
+    def compute_lang_id_pred_scores(documents, model_lang_id):
+        """Same as compute_lang_id_pred_score, but for a list of documents,
+        which are all predicted in a single call to the Fasttext model."""
+        documents = [document.lower().replace("\n", " ") for document in documents]
+        labels, scores = model_lang_id.predict(documents)
+        lang_pred_dataset_ids = {
+            label[0]: Filtering.get_lang_pred_dataset_id(label[0])
+            for label in labels
+            if label
+        }
+        # Fasttext returns no prediction for documents without any word
+        lang_id_pred_scores = [
+            (lang_pred_dataset_ids[label[0]], score[0]) if label else ("unknown", 0.0)
+            for label, score in zip(labels, scores)
+        ]
+        return lang_id_pred_scores
+
     @staticmethod
     def check_lang_id(
         document,
         lang_dataset_id,
         model_lang_id,
         lang_id_min_cutoff,
+        lang_id_pred_score=None,
     ):
+        """lang_id_pred_score can be precomputed with compute_lang_id_pred_scores."""
         cond = True
         if model_lang_id:
-            lang_pred_dataset_id, score_pred = Filtering.compute_lang_id_pred_score(
-                document, model_lang_id
-            )
+            if lang_id_pred_score is None:
+                lang_id_pred_score = Filtering.compute_lang_id_pred_score(
+                    document, model_lang_id
+                )
+            lang_pred_dataset_id, score_pred = lang_id_pred_score
             cond = (lang_pred_dataset_id == lang_dataset_id) and (
                 score_pred >= lang_id_min_cutoff
             )
@@ -754,6 +770,7 @@ class Filtering:
         sentencepiece_model,
         kenlm_model,
         perplexity_max_cutoff,
+        lang_id_pred_score=None,
     ):
         if cond_check_number_words:
             if not Filtering.check_number_words(
@@ -817,6 +834,7 @@ class Filtering:
                 lang_dataset_id,
                 model_lang_id,
                 lang_id_min_cutoff,
+                lang_id_pred_score,
             ):
                 return False
         if cond_check_perplexity:
@@ -859,9 +877,22 @@ class FunctionDatasetFiltering:
             lang_dataset_id, path_kenlm_model
         )
 
-    def __call__(self, example):
-        keep_example = Filtering.filtering(
-            document=example["text"],
+    def __call__(self, examples):
+        documents = examples["text"]
+        if self.param["cond_check_lang_id"] and self.model_lang_id:
+            lang_id_pred_scores = Filtering.compute_lang_id_pred_scores(
+                documents, self.model_lang_id
+            )
+        else:
+            lang_id_pred_scores = [None] * len(documents)
+        return [
+            self.keep_document(document, lang_id_pred_score)
+            for document, lang_id_pred_score in zip(documents, lang_id_pred_scores)
+        ]
+
+    def keep_document(self, document, lang_id_pred_score=None):
+        keep_document = Filtering.filtering(
+            document=document,
             cond_check_number_words=self.param["cond_check_number_words"],
             sentencepiece_model_tok=self.sentencepiece_model_tok,
             strip_characters=self.param["strip_characters"],
@@ -899,8 +930,60 @@ class FunctionDatasetFiltering:
             sentencepiece_model=self.sentencepiece_model,
             kenlm_model=self.kenlm_model,
             perplexity_max_cutoff=self.param["perplexity_max_cutoff"],
+            lang_id_pred_score=lang_id_pred_score,
         )
-        return keep_example
+        return keep_document
+
+    def __reduce__(self):
+        return (
+            self.__class__,
+            (
+                self.lang_dataset_id,
+                self.path_fasttext_model,
+                self.path_sentencepiece_model,
+                self.path_kenlm_model,
+            ),
+        )
+
+
+class FunctionDatasetModifyingDocumentsAndFiltering:
+    """Modify and filter a batch of documents in a single pass,
+    so that the modified documents are never written to disk
+    before being filtered."""
+
+    def __init__(
+        self,
+        lang_dataset_id,
+        path_fasttext_model,
+        path_sentencepiece_model,
+        path_kenlm_model,
+    ):
+        self.lang_dataset_id = lang_dataset_id
+        self.path_fasttext_model = path_fasttext_model
+        self.path_sentencepiece_model = path_sentencepiece_model
+        self.path_kenlm_model = path_kenlm_model
+
+        self.func_dataset_modifying_documents = FunctionDatasetModifyingDocuments(
+            lang_dataset_id
+        )
+        self.func_dataset_filtering = FunctionDatasetFiltering(
+            lang_dataset_id,
+            path_fasttext_model,
+            path_sentencepiece_model,
+            path_kenlm_model,
+        )
+
+    def __call__(self, examples):
+        examples["text"] = [
+            self.func_dataset_modifying_documents.modifying_document(document)
+            for document in examples["text"]
+        ]
+        keep_examples = self.func_dataset_filtering(examples)
+        examples = {
+            column: [value for value, keep in zip(values, keep_examples) if keep]
+            for column, values in examples.items()
+        }
+        return examples
 
     def __reduce__(self):
         return (
@@ -924,6 +1007,7 @@ class DatasetFiltering:
         path_kenlm_model,
         num_proc,
         path_dir_save_dataset,
+        batch_size=1000,
     ):
         self.ds = dataset
         self.lang_dataset_id = lang_dataset_id
@@ -932,6 +1016,7 @@ class DatasetFiltering:
         self.path_kenlm_model = path_kenlm_model
         self.num_proc = num_proc
         self.path_dir_save_dataset = path_dir_save_dataset
+        self.batch_size = batch_size
 
     def modifying_documents(self):
         func_dataset_modifying_documents = FunctionDatasetModifyingDocuments(
@@ -946,7 +1031,28 @@ class DatasetFiltering:
             self.path_sentencepiece_model,
             self.path_kenlm_model,
         )
-        self.ds = self.ds.filter(func_dataset_filtering, num_proc=self.num_proc)
+        self.ds = self.ds.filter(
+            func_dataset_filtering,
+            batched=True,
+            batch_size=self.batch_size,
+            num_proc=self.num_proc,
+        )
+
+    def modifying_documents_and_filtering(self):
+        func_dataset_modifying_documents_and_filtering = (
+            FunctionDatasetModifyingDocumentsAndFiltering(
+                self.lang_dataset_id,
+                self.path_fasttext_model,
+                self.path_sentencepiece_model,
+                self.path_kenlm_model,
+            )
+        )
+        self.ds = self.ds.map(
+            func_dataset_modifying_documents_and_filtering,
+            batched=True,
+            batch_size=self.batch_size,
+            num_proc=self.num_proc,
+        )
 
     def save_dataset(self):
         pathlib.Path(self.path_dir_save_dataset).mkdir(parents=True, exist_ok=True)
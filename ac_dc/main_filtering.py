@@ -1,12 +1,15 @@
 """Filtering."""
 
 from multiprocessing import cpu_count
+from typing import Optional
 
 import argparse
+import os
+import shutil
+import urllib.request
 
-from datasets import load_dataset
-
-from filtering import DatasetFiltering
+# Skip the telemetry calls made by huggingface_hub
+os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
 
 
 def check_num_proc(num_proc: int = -1) -> int:
@@ -42,6 +45,76 @@ def check_num_proc(num_proc: int = -1) -> int:
     return num_proc
 
 
+_URL_FASTTEXT_MODELS = "https://dl.fbaipublicfiles.com/fasttext/supervised-models"
+_URL_SENTENCEPIECE_KENLM_MODELS = (
+    "https://huggingface.co/edugp/kenlm/resolve/main/wikipedia"
+)
+
+
+def resolve_model(
+    path: str,
+    url: str,
+    cache_dir: Optional[str] = None,
+    network_cache_url: Optional[str] = None,
+    timeout: float = 60.0,
+) -> str:
+    """
+    Resolve the path of a model, downloading it if it is not available locally.
+
+    The model is looked for on the local disk first (at `path`, then in
+    `cache_dir`), then in the network cache, and finally at its original URL.
+    Downloaded models are saved in `cache_dir`, so that the following runs
+    and the other processes of the host find them on the local disk.
+
+    Parameters
+    ----------
+    path : str
+        Local path of the model
+    url : str
+        Original URL of the model
+    cache_dir : str, optional
+        Directory where downloaded models are saved, by default the directory of `path`
+    network_cache_url : str, optional
+        URL of a shared cache containing the models, by default None
+    timeout : float, optional
+        Timeout in seconds of the connection and of each read, by default 60.0
+
+    Returns
+    -------
+    str
+        Path of the model, unchanged if it could not be downloaded
+    """
+    if os.path.exists(path):
+        return path
+    file_name = os.path.basename(path)
+    if cache_dir is None:
+        cache_dir = os.path.dirname(path)
+    cache_path = os.path.join(cache_dir, file_name)
+    if os.path.exists(cache_path):
+        return cache_path
+
+    urls = [url]
+    if network_cache_url:
+        urls.insert(0, f"{network_cache_url.rstrip('/')}/{file_name}")
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    for url_model in urls:
+        # Download to a temporary file so that concurrent runs never see a partial model
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            with urllib.request.urlopen(url_model, timeout=timeout) as response:
+                with open(tmp_path, "wb") as f:
+                    shutil.copyfileobj(response, f)
+        except OSError:
+            print(f"Warning: Download failed for model {url_model}.")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            continue
+        os.replace(tmp_path, cache_path)
+        return cache_path
+    return path
+
+
 def parseArgs():
     parser = argparse.ArgumentParser(description="Filtering.")
     parser.add_argument(
@@ -77,7 +150,7 @@ def parseArgs():
     parser.add_argument(
         "--path_fasttext_model",
         type=str,
-        default="ac_dc/lid.176.bin",
+        default="ac_dc/lid.176.ftz",
         help="Path to the Fasttext model used for language identification.",
     )
     parser.add_argument(
@@ -92,12 +165,30 @@ def parseArgs():
         default="ac_dc/af.arpa.bin",
         help="Path to the KenLM model used to compute perplexity scores.",
     )
+    parser.add_argument(
+        "--model_cache_dir",
+        type=str,
+        default=None,
+        help="Directory where the models not found locally are downloaded. Default at the directory of each model path.",
+    )
+    parser.add_argument(
+        "--network_cache_url",
+        type=str,
+        default=os.environ.get("HF_MODEL_CACHE_NETWORK_LOCATION"),
+        help="URL of a shared cache containing the models, tried before their original URLs. Default at the environment variable HF_MODEL_CACHE_NETWORK_LOCATION.",
+    )
     parser.add_argument(
         "--num_proc",
         type=int,
         default=-1,
         help="Number of processes for multiprocessing. Default at the number of processors available.",
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        default=1000,
+        help="Number of documents per batch when filtering the dataset.",
+    )
     parser.add_argument(
         "--path_dir_save_dataset",
         type=str,
@@ -111,6 +202,28 @@ def parseArgs():
 def main():
     args = parseArgs()
 
+    # Imported here since loading datasets and the models libraries is slow,
+    # and not needed to print the help or report wrong arguments
+    from datasets import load_dataset
+
+    from filtering import DatasetFiltering
+
+    # Resolve the models first, so that a missing model is reported
+    # before the potentially long loading of the dataset
+    path_fasttext_model, path_sentencepiece_model, path_kenlm_model = [
+        resolve_model(
+            path,
+            url=f"{url}/{os.path.basename(path)}",
+            cache_dir=args.model_cache_dir,
+            network_cache_url=args.network_cache_url,
+        )
+        for path, url in [
+            (args.path_fasttext_model, _URL_FASTTEXT_MODELS),
+            (args.path_sentencepiece_model, _URL_SENTENCEPIECE_KENLM_MODELS),
+            (args.path_kenlm_model, _URL_SENTENCEPIECE_KENLM_MODELS),
+        ]
+    ]
+
     dataset = load_dataset(
         args.dataset_name,
         args.config_name,
@@ -121,14 +234,14 @@ def main():
     dataset_filtering = DatasetFiltering(
         dataset=dataset,
         lang_dataset_id=args.lang_dataset_id,
-        path_fasttext_model=args.path_fasttext_model,
-        path_sentencepiece_model=args.path_sentencepiece_model,
-        path_kenlm_model=args.path_kenlm_model,
+        path_fasttext_model=path_fasttext_model,
+        path_sentencepiece_model=path_sentencepiece_model,
+        path_kenlm_model=path_kenlm_model,
         num_proc=check_num_proc(args.num_proc),
         path_dir_save_dataset=args.path_dir_save_dataset,
+        batch_size=args.batch_size,
     )
-    dataset_filtering.modifying_documents()
-    dataset_filtering.filtering()
+    dataset_filtering.modifying_documents_and_filtering()
     dataset_filtering.save_dataset()
 
 
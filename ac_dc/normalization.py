@@ -1,5 +1,5 @@
 import re
-from typing import Dict
+from typing import Dict, List
 
 
 non_printing_characters_re = re.compile(
@@ -8,6 +8,21 @@ non_printing_characters_re = re.compile(
 
 digits_re: re.Pattern = re.compile(r"\d")
 
+whitespace: List[str] = [
+    " ",
+    " ",
+    " ",
+    " ",
+    " ",
+    "　",
+    " ",
+    " ",
+    " ",
+    " ",
+    "￼",
+    "",
+]
+
 unicode_punctuation: Dict[str, str] = {
     "，": ",",
     "。": ".",
@@ -45,8 +60,15 @@ unicode_punctuation: Dict[str, str] = {
     "►": "-",
 }
 
+# translation tables used by str.translate, built once rather than per document
+whitespace_table: Dict[int, str] = str.maketrans(dict.fromkeys(whitespace, " "))
+
+unicode_punctuation_table: Dict[int, str] = str.maketrans(unicode_punctuation)
+
 normalization = {
     "non_printing_characters_re": non_printing_characters_re,
     "digits_re": digits_re,
     "unicode_punctuation": unicode_punctuation,
+    "whitespace_table": whitespace_table,
+    "unicode_punctuation_table": unicode_punctuation_table,
 }
@@ -0,0 +1,154 @@
+import numpy as np
+import pytest
+from datasets import Dataset
+
+from filtering import (
+    DatasetFiltering,
+    Filtering,
+    FunctionDatasetFiltering,
+    LoadParameters,
+)
+
+# The models are replaced by stubs, so that the tests do not need
+# to download them nor to install fasttext, sentencepiece and kenlm
+
+
+class FasttextModelStub:
+    """Predict French for the documents containing "bonjour", English for the
+    other ones, and nothing for the documents without any word, like Fasttext."""
+
+    def predict_one(self, text):
+        assert "\n" not in text
+        if not text.split():
+            return (), np.array([])
+        if "bonjour" in text:
+            return ("__label__fr",), np.array([0.9])
+        if "maybe" in text:
+            return ("__label__en",), np.array([0.5])
+        return ("__label__en",), np.array([0.95])
+
+    def predict(self, text):
+        if isinstance(text, str):
+            return self.predict_one(text)
+        predictions = [self.predict_one(document) for document in text]
+        labels = [list(label) for label, _ in predictions]
+        scores = [score for _, score in predictions]
+        return labels, scores
+
+
+class SentencepieceModelStub:
+    def encode_as_pieces(self, document):
+        return document.split()
+
+
+class KenlmModelStub:
+    """Give a high perplexity to the lines containing "gibberish"."""
+
+    def score(self, line):
+        log_score_word = -10.0 if "gibberish" in line else -1.0
+        return log_score_word * len(line.split())
+
+
+@pytest.fixture
+def stub_models(monkeypatch):
+    for load_model, model in [
+        ("load_model_lang_id", FasttextModelStub()),
+        ("load_sentencepiece_model", SentencepieceModelStub()),
+        ("load_kenlm_model", KenlmModelStub()),
+    ]:
+        monkeypatch.setattr(
+            LoadParameters,
+            load_model,
+            staticmethod(lambda lang_dataset_id, path, model=model: model),
+        )
+
+
+def get_documents():
+    sentences = [
+        "The old man walked to the market in the morning, and he bought some bread and fresh fruit for his family.",
+        "When the rain stopped, the children ran out into the garden to play with the dog that lived next door.",
+        "She was reading a book about the history of the city while her brother was cooking dinner for the two of them.",
+        "It is not easy to learn a new language, but with some practice every day you will make good progress.",
+    ]
+    return [
+        *sentences,
+        "Maybe " + sentences[0],
+        "bonjour " + sentences[1],
+        "gibberish " + sentences[2],
+        "Too short.",
+        "",
+        "\n",
+        sentences[3].replace(" ", "\n", 5),
+    ]
+
+
+def test_compute_lang_id_pred_scores():
+    model_lang_id = FasttextModelStub()
+    documents = get_documents()
+    lang_id_pred_scores = Filtering.compute_lang_id_pred_scores(
+        documents, model_lang_id
+    )
+    assert len(lang_id_pred_scores) == len(documents)
+    for document, lang_id_pred_score in zip(documents, lang_id_pred_scores):
+        if document.split():
+            assert lang_id_pred_score == Filtering.compute_lang_id_pred_score(
+                document, model_lang_id
+            )
+        else:
+            # Fasttext returns an empty label for the documents without any word
+            assert lang_id_pred_score == ("unknown", 0.0)
+    assert lang_id_pred_scores[:6] == [
+        ("en", 0.95),
+        ("en", 0.95),
+        ("en", 0.95),
+        ("en", 0.95),
+        ("en", 0.5),
+        ("fr", 0.9),
+    ]
+
+
+def test_function_dataset_filtering_batch(stub_models):
+    func_dataset_filtering = FunctionDatasetFiltering(
+        "en", "lid.176.bin", "en.sp.model", "en.arpa.bin"
+    )
+    documents = get_documents()
+    keep_examples = func_dataset_filtering({"text": documents})
+    # The batch gives the same result as filtering the documents one by one
+    assert keep_examples == [
+        func_dataset_filtering.keep_document(document) for document in documents
+    ]
+    assert keep_examples == [True] * 4 + [False] * 6 + [True]
+
+
+def test_modifying_documents_and_filtering(stub_models, tmp_path):
+    documents = get_documents()
+    # Documents changed by modifying_documents, kept or not afterwards
+    documents += [
+        "  " + documents[0].replace(" ", "\u2003", 3) + "  ",
+        documents[1] + " See www.example.com and " + "a" * 30,
+        "bonjour\u2003" + documents[2],
+    ]
+    dataset = Dataset.from_dict({"id": list(range(len(documents))), "text": documents})
+
+    def get_dataset_filtering():
+        return DatasetFiltering(
+            dataset=dataset,
+            lang_dataset_id="en",
+            path_fasttext_model="lid.176.bin",
+            path_sentencepiece_model="en.sp.model",
+            path_kenlm_model="en.arpa.bin",
+            num_proc=None,
+            path_dir_save_dataset=str(tmp_path),
+            batch_size=4,
+        )
+
+    two_passes = get_dataset_filtering()
+    two_passes.modifying_documents()
+    two_passes.filtering()
+    single_pass = get_dataset_filtering()
+    single_pass.modifying_documents_and_filtering()
+
+    assert single_pass.ds.to_dict() == two_passes.ds.to_dict()
+    assert single_pass.ds["id"] == [0, 1, 2, 3, 10, 11, 12]
+    assert single_pass.ds["text"][5] == documents[0]
+    assert single_pass.ds["text"][6] == documents[1] + " See and"
@@ -0,0 +1,108 @@
+import os
+
+import main_filtering
+from main_filtering import resolve_model
+
+
+def make_model(directory, content=b"model"):
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / "en.bin"
+    path.write_bytes(content)
+    return path
+
+
+def list_tmp_files(directory):
+    return [name for name in os.listdir(directory) if name.endswith(".tmp")]
+
+
+def test_resolve_model_local_path(tmp_path):
+    path = make_model(tmp_path / "models")
+    url = (tmp_path / "missing" / "en.bin").as_uri()
+    assert resolve_model(str(path), url, cache_dir=str(tmp_path / "cache")) == str(path)
+    assert not (tmp_path / "cache").exists()
+
+
+def test_resolve_model_cache_dir(tmp_path):
+    cache_path = make_model(tmp_path / "cache")
+    path = tmp_path / "models" / "en.bin"
+    url = (tmp_path / "missing" / "en.bin").as_uri()
+    assert resolve_model(str(path), url, cache_dir=str(tmp_path / "cache")) == str(
+        cache_path
+    )
+
+
+def test_resolve_model_network_cache(tmp_path):
+    make_model(tmp_path / "network_cache", b"network cache")
+    make_model(tmp_path / "origin", b"origin")
+    cache_dir = tmp_path / "cache"
+    resolved = resolve_model(
+        str(tmp_path / "models" / "en.bin"),
+        (tmp_path / "origin" / "en.bin").as_uri(),
+        cache_dir=str(cache_dir),
+        network_cache_url=(tmp_path / "network_cache").as_uri(),
+    )
+    assert resolved == str(cache_dir / "en.bin")
+    assert (cache_dir / "en.bin").read_bytes() == b"network cache"
+    assert list_tmp_files(cache_dir) == []
+
+
+def test_resolve_model_falls_back_to_original_url(tmp_path):
+    make_model(tmp_path / "origin", b"origin")
+    cache_dir = tmp_path / "cache"
+    resolved = resolve_model(
+        str(tmp_path / "models" / "en.bin"),
+        (tmp_path / "origin" / "en.bin").as_uri(),
+        cache_dir=str(cache_dir),
+        network_cache_url=(tmp_path / "network_cache").as_uri(),
+    )
+    assert resolved == str(cache_dir / "en.bin")
+    assert (cache_dir / "en.bin").read_bytes() == b"origin"
+
+
+def test_resolve_model_download_failure(tmp_path, monkeypatch):
+    make_model(tmp_path / "network_cache", b"network cache")
+    make_model(tmp_path / "origin", b"origin")
+    cache_dir = tmp_path / "cache"
+
+    def copyfileobj(fsrc, fdst):
+        # Fail in the middle of every download, after the temporary file is created
+        fdst.write(fsrc.read(2))
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(main_filtering.shutil, "copyfileobj", copyfileobj)
+    path = str(tmp_path / "models" / "en.bin")
+    resolved = resolve_model(
+        path,
+        (tmp_path / "origin" / "en.bin").as_uri(),
+        cache_dir=str(cache_dir),
+        network_cache_url=(tmp_path / "network_cache").as_uri(),
+    )
+    assert resolved == path
+    assert os.listdir(cache_dir) == []
+
+
+def test_resolve_model_partial_download_is_not_cached(tmp_path, monkeypatch):
+    make_model(tmp_path / "network_cache", b"network cache")
+    make_model(tmp_path / "origin", b"origin")
+    cache_dir = tmp_path / "cache"
+    copyfileobj = main_filtering.shutil.copyfileobj
+    calls = []
+
+    def fail_first_copyfileobj(fsrc, fdst):
+        calls.append(fsrc)
+        if len(calls) == 1:
+            fdst.write(fsrc.read(2))
+            raise OSError("connection reset")
+        copyfileobj(fsrc, fdst)
+
+    monkeypatch.setattr(main_filtering.shutil, "copyfileobj", fail_first_copyfileobj)
+    resolved = resolve_model(
+        str(tmp_path / "models" / "en.bin"),
+        (tmp_path / "origin" / "en.bin").as_uri(),
+        cache_dir=str(cache_dir),
+        network_cache_url=(tmp_path / "network_cache").as_uri(),
+    )
+    assert len(calls) == 2
+    assert resolved == str(cache_dir / "en.bin")
+    assert (cache_dir / "en.bin").read_bytes() == b"origin"
+    assert list_tmp_files(cache_dir) == []
@@ -176,7 +176,7 @@ if __name__ == "__main__":
     num_iter = 15000
 
     lang_dataset_id = lang_dataset_id
-    path_fasttext_model = "ac_dc/lid.176.bin"
+    path_fasttext_model = "ac_dc/lid.176.ftz"
     path_sentencepiece_model = f"ac_dc/{lang_dataset_id}.sp.model"
     path_kenlm_model = f"ac_dc/{lang_dataset_id}.arpa.bin"
     path_save_stats = f"ac_dc/visualization/{lang_dataset_id}_examples_with_stats.json"
@@ -913,7 +913,7 @@ param_visu_langs = {
         "num_docs_for_words": 1500,
         "max_len_text_display": 10000,
         "lang_dataset_id": lang_dataset_id,
-        "path_fasttext_model": "./ac_dc/lid.176.bin",
+        "path_fasttext_model": "./ac_dc/lid.176.ftz",
         "path_sentencepiece_model": f"./ac_dc/{lang_dataset_id}.sp.model",
         "path_kenlm_model": f"./ac_dc/{lang_dataset_id}.arpa.bin",
     }
@@ -1,11 +1,26 @@
 import argparse
+import glob
 import gzip
-import json
+import importlib.util
+import io
+import os
+from collections import Counter
 
-import datasets
-from datasets import Features, load_dataset
-from huggingface_hub import HfApi
-from tqdm import tqdm
+import orjson
+import xxhash
+import zstandard as zstd
+
+# the heavier dependencies (datasets, huggingface_hub, numpy, tqdm) are imported
+# in the functions using them so that --help and argument errors return right
+# away, this also lets the environment below be set before huggingface_hub is
+# imported (it reads it at import time, also when imported through datasets)
+
+# upload files with parallel connections when hf_transfer is installed
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+
+# skip the telemetry calls made by huggingface_hub
+os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
 
 ###
 # features of the pseudocrawl seeds
@@ -58,106 +73,206 @@ features = {
 }
 
 
-def convert_types(features):
-    if isinstance(features, dict) and "_type" in features:
-        return getattr(datasets, features["_type"])(features["dtype"])
-    elif isinstance(features, dict):
-        return {key: convert_types(value) for key, value in features.items()}
-    elif isinstance(features, list):
-        return [convert_types(value) for value in features]
+# columns of the seeds used to build the processed seed
+_COLUMNS_TO_KEEP = {"url", "content_languages", "seed_id", "text"}
 
-
-final_features = convert_types(features)
-final_features = Features(final_features)
-final_features
+# features of the processed seed, the hash is only used for deduplication
+processed_features = {
+    "meta": {
+        "url": {"dtype": "string", "id": null, "_type": "Value"},
+        "content_languages": {"dtype": "string", "id": null, "_type": "Value"},
+        "seed_id": {"dtype": "int32", "id": null, "_type": "Value"},
+    },
+    "text": {"dtype": "string", "id": null, "_type": "Value"},
+    "_hash": {"dtype": "int64", "id": null, "_type": "Value"},
+}
 
 ###
 # seed processing and upload functions
 ###
 
 
-# extract just the metadata we wish to keep
-def get_meta_dict(page):
-    meta = {k: page[k] for k in ["url", "content_languages", "seed_id"]}
-    return meta
+# lines are identified by the 64-bit hash of their stripped text
+def hash_line(line):
+    return xxhash.xxh3_64_intdigest(line.encode())
 
 
 # filter text to remove certain lines (e.g. menu items, copyright notice)
-def filter_lines(article, skip_dict):
-    lines = [line.strip() for line in article.split("\n")]
-    keep = []
-    skip = []
-    for line in lines:
-        if skip_dict.get(line, False):
-            skip += [line]
-        else:
-            keep += [line]
-    return "\n".join(keep).strip(), "\n".join(skip).strip()
+def filter_lines(article, skip_set):
+    lines = map(str.strip, article.split("\n"))
+    return "\n".join(line for line in lines if hash_line(line) not in skip_set).strip()
 
 
-# do both together and return an entry
-def process_page(page, skip_dict):
-    meta = get_meta_dict(page)
-    text, _ = filter_lines(page["text"], skip_dict)
-    return {
-        "meta": meta,
-        "text": text,
-    }
+# parameters of get_lines_to_skip, saved with its result so that a cached
+# result computed with other parameters is not reused
+_SKIP_LINES_PARAMS = {
+    "line_hash": "xxh3_64",
+    "page_hash": "xxh3_128",
+    "max_pages": 10000,
+    "min_count": 10,
+    "page_ratio": 100,
+}
 
 
 # looks at up to the first 10K pages for a seed and
-# records lines that appear in at least 1% of the unique pages
+# records the hashes of lines that appear in at least 1% of the unique pages
 def get_lines_to_skip(dset):
-    line_counts = {}
-    seen_pages = {}
-    dset_sample = dset["train"].select(range(10000))
-    for page in tqdm(dset_sample):
-        article = page["text"]
-        if not seen_pages.get(article, False):
-            seen_pages[article] = True
-            for line in article.split("\n"):
-                line_counts[line.strip()] = line_counts.get(line.strip(), 0) + 1
-    thres_skip = max(10, len(seen_pages) // 100)
-    skip_dict = {line: True for line, ct in line_counts.items() if ct > thres_skip}
-    return skip_dict
+    from tqdm import tqdm
+
+    line_counts = Counter()
+    seen_pages = set()
+    num_pages = min(_SKIP_LINES_PARAMS["max_pages"], len(dset["train"]))
+    dset_sample = dset["train"].select(range(num_pages))
+    for article in tqdm(dset_sample["text"]):
+        article_hash = xxhash.xxh3_128_intdigest(article.encode())
+        if article_hash in seen_pages:
+            continue
+        seen_pages.add(article_hash)
+        line_counts.update(map(hash_line, map(str.strip, article.split("\n"))))
+    thres_skip = max(
+        _SKIP_LINES_PARAMS["min_count"],
+        len(seen_pages) // _SKIP_LINES_PARAMS["page_ratio"],
+    )
+    return frozenset(
+        line_hash for line_hash, ct in line_counts.items() if ct > thres_skip
+    )
+
+
+# identifies the inputs of get_lines_to_skip: its parameters and the shards read
+def get_lines_to_skip_header(shard_files):
+    shards = []
+    for shard in shard_files:
+        stat = os.stat(shard)
+        shards.append([shard, stat.st_size, stat.st_mtime_ns])
+    return {**_SKIP_LINES_PARAMS, "shards": shards}
+
+
+# reuse the lines to skip saved by a previous run if they were computed
+# with the same parameters from the same shards
+def load_or_get_lines_to_skip(dset, cache_file, shard_files):
+    header = get_lines_to_skip_header(shard_files)
+    if os.path.exists(cache_file):
+        with open(cache_file, "rb") as f:
+            try:
+                cached = orjson.loads(zstd.ZstdDecompressor().decompress(f.read()))
+            except (zstd.ZstdError, orjson.JSONDecodeError):
+                cached = None
+        if isinstance(cached, dict) and cached.get("header") == header:
+            return frozenset(cached["lines"])
+    skip_lines_set = get_lines_to_skip(dset)
+    os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+    with open(cache_file, "wb") as f:
+        cached = {"header": header, "lines": sorted(skip_lines_set)}
+        f.write(zstd.ZstdCompressor().compress(orjson.dumps(cached)))
+    return skip_lines_set
+
+
+# filter the lines of a batch of pages, drop the pages that end up too short,
+# and hash the normalized text so that duplicates can be removed afterwards
+# (the 64-bit hash is shifted into the int64 range that Arrow accepts)
+def process_batch(batch, skip_set, min_chars):
+    processed = {"meta": [], "text": [], "_hash": []}
+    for url, content_languages, seed_id, article in zip(
+        batch["url"], batch["content_languages"], batch["seed_id"], batch["text"]
+    ):
+        text = filter_lines(article, skip_set)
+        if len(text) <= min_chars:
+            continue
+        processed["meta"].append(
+            {"url": url, "content_languages": content_languages, "seed_id": seed_id}
+        )
+        processed["text"].append(text)
+        processed["_hash"].append(
+            xxhash.xxh64_intdigest(text.lower().encode()) - 2**63
+        )
+    return processed
 
 
 # create a private repository and push processed seed in jsonl format
-def make_seed_jsonl(dset, language, name, skip_lines_dict, min_chars=32, gzipped=False):
+def make_seed_jsonl(
+    dset, language, name, skip_lines_set, min_chars=32, gzipped=False, num_proc=None
+):
+    import numpy as np
+    from datasets import Features
+
     repo_name = f"lm_{language}_pseudocrawl_{name}"
-    # process and write to file
-    if gzipped:
-        file_name = f"{repo_name}.jsonl.gz"
-        f = gzip.open(file_name, "w")
-    else:
-        file_name = f"{repo_name}.jsonl"
-        f = open(file_name, "w", encoding="utf-8")
-    duplicated = {}
-    for article in tqdm(dset["train"]):
-        processed_dct = process_page(article, skip_lines_dict)
-        txt = processed_dct["text"].strip().lower()
-        if len(processed_dct["text"]) > min_chars and txt not in duplicated:
-            _ = f.write((json.dumps(processed_dct) + "\n").encode("utf-8"))
-    f.close()
+    processed = dset["train"].map(
+        process_batch,
+        batched=True,
+        batch_size=1000,
+        num_proc=num_proc,
+        remove_columns=dset["train"].column_names,
+        features=Features.from_dict(processed_features),
+        fn_kwargs={"skip_set": skip_lines_set, "min_chars": min_chars},
+    )
+    # only keep the first occurrence of each text
+    _, first_indices = np.unique(
+        processed.with_format("numpy")["_hash"], return_index=True
+    )
+    processed = processed.select(np.sort(first_indices)).remove_columns("_hash")
+    # write to file
+    file_name = f"{repo_name}.jsonl.gz" if gzipped else f"{repo_name}.jsonl.zst"
+    write_jsonl(processed, file_name, gzipped=gzipped)
     return file_name, repo_name
 
 
+# stream the processed seed to a gzip or zstandard compressed jsonl file, the
+# BufferedWriter needs the compressor to report the uncompressed bytes it read
+def write_jsonl(dset, file_name, gzipped=False, batch_size=10000):
+    with open(file_name, "wb") as f:
+        if gzipped:
+            compressed = gzip.GzipFile(fileobj=f, mode="wb")
+        else:
+            compressed = zstd.ZstdCompressor(level=3, threads=-1).stream_writer(
+                f, write_return_read=True
+            )
+        with io.BufferedWriter(compressed, buffer_size=1 << 20) as writer:
+            for i in range(0, len(dset), batch_size):
+                batch = dset[i : i + batch_size]
+                for meta, text in zip(batch["meta"], batch["text"]):
+                    writer.write(
+                        orjson.dumps(
+                            {"meta": meta, "text": text},
+                            option=orjson.OPT_APPEND_NEWLINE,
+                        )
+                    )
+
+
 def push_jsonl_to_hub(file_name, repo_name, token):
+    from huggingface_hub import CommitOperationAdd, HfApi
+
     api = HfApi()
+    repo_id = f"bigscience-catalogue-lm-data/{repo_name}"
     api.create_repo(
-        f"bigscience-catalogue-lm-data/{repo_name}",
+        repo_id,
         private=True,
         repo_type="dataset",
         token=token,
     )
-    file_loc = api.upload_file(
-        path_or_fileobj=file_name,
-        path_in_repo=file_name,
-        repo_id=f"bigscience-catalogue-lm-data/{repo_name}",
+    # upload the file content in parallel chunks before committing it
+    operation = CommitOperationAdd(path_in_repo=file_name, path_or_fileobj=file_name)
+    api.preupload_lfs_files(
+        repo_id=repo_id,
+        additions=[operation],
         token=token,
         repo_type="dataset",
     )
-    return file_loc
+    commit_info = api.create_commit(
+        repo_id=repo_id,
+        operations=[operation],
+        commit_message=f"Upload {file_name}",
+        token=token,
+        repo_type="dataset",
+    )
+    return commit_info
+
+
+# list the non-empty compressed shards of a seed
+def get_seed_shard_files(pseudo_crawl_path, seed_id):
+    shard_files = sorted(
+        glob.glob(f"{pseudo_crawl_path}/seed_id={seed_id}/text__html/*.jsonl.gz")
+    )
+    return [shard for shard in shard_files if os.path.getsize(shard) > 0]
 
 
 ###
@@ -196,9 +311,16 @@ def main():
     parser.add_argument(
         "-gz",
         "--gzipped",
-        help="Write file directly in jsonl.gz compresed format",
+        help="Write file in the legacy jsonl.gz format instead of jsonl.zst",
         action="store_true",
     )
+    parser.add_argument(
+        "-np",
+        "--num_proc",
+        help="number of processes used to load and filter the seed",
+        default=1,
+        type=int,
+    )
     parser.add_argument(
         "-hub",
         "--push_to_hub",
@@ -216,23 +338,38 @@ def main():
     assert not (
         args.push_to_hub and args.token == ""
     ), "If you want the script to push to the hub, you need to provide an authentication token"
+    shard_files = get_seed_shard_files(args.pseudo_crawl_path, args.seed_id)
+    assert (
+        shard_files
+    ), f"No shard found for seed {args.seed_id} in {args.pseudo_crawl_path}"
+    from datasets import Features, load_dataset
+
     # Load dataset (data first needs to be git pulled, see above)
+    # each process decompresses and parses whole shards
     dset = load_dataset(
         "json",
-        data_files=[
-            f"{args.pseudo_crawl_path}/seed_id={args.seed_id}/text__html/*.jsonl.gz"
-        ],
-        features=final_features,
+        data_files=shard_files,
+        features=Features.from_dict(features),
         cache_dir=f"cache_seed_{args.seed_id}",
+        num_proc=min(args.num_proc, len(shard_files)),
+    )
+    # drop the html columns, which make up most of the data but are never used
+    dset = dset.remove_columns(
+        [name for name in dset["train"].column_names if name not in _COLUMNS_TO_KEEP]
+    )
+    skip_lines_set = load_or_get_lines_to_skip(
+        dset,
+        cache_file=f"cache_seed_{args.seed_id}/skip_lines.json.zst",
+        shard_files=shard_files,
     )
-    skip_lines_dict = get_lines_to_skip(dset)
     file_name, repo_name = make_seed_jsonl(
         dset,
         language=args.language_code,
         name=args.name,
-        skip_lines_dict=skip_lines_dict,
+        skip_lines_set=skip_lines_set,
         min_chars=128,  # only keep examples with at least 128 characters
         gzipped=args.gzipped,
+        num_proc=args.num_proc,
     )
     if args.push_to_hub:
         push_jsonl_to_hub(file_name, repo_name, args.token)
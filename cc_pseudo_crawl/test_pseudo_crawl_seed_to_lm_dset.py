@@ -0,0 +1,115 @@
+import gzip
+import os
+
+import orjson
+import pytest
+import zstandard as zstd
+from datasets import Dataset, DatasetDict
+
+import pseudo_crawl_seed_to_lm_dset
+from pseudo_crawl_seed_to_lm_dset import (
+    hash_line,
+    load_or_get_lines_to_skip,
+    make_seed_jsonl,
+)
+
+
+def get_seed(num_pages=100):
+    texts = [
+        f"Menu\n  Page {i} has enough words to be kept in the seed, café  \nCopyright"
+        for i in range(num_pages)
+    ]
+    # duplicated pages and pages too short once filtered
+    texts += [
+        texts[0],
+        texts[1].replace("Page 1 has", "PAGE 1 HAS"),
+        "Menu\nToo short\nCopyright",
+    ]
+    return DatasetDict(
+        {
+            "train": Dataset.from_dict(
+                {
+                    "url": [f"https://example.com/{i}" for i in range(len(texts))],
+                    "content_languages": ["en"] * len(texts),
+                    "seed_id": [1] * len(texts),
+                    "text": texts,
+                }
+            )
+        }
+    )
+
+
+def read_lines(file_name):
+    with open(file_name, "rb") as f:
+        if file_name.endswith(".gz"):
+            return gzip.decompress(f.read()).splitlines()
+        return zstd.ZstdDecompressor().stream_reader(f).read().splitlines()
+
+
+@pytest.mark.parametrize("gzipped", [False, True])
+def test_make_seed_jsonl(tmp_path, monkeypatch, gzipped):
+    monkeypatch.chdir(tmp_path)
+    skip_lines_set = frozenset({hash_line("Menu"), hash_line("Copyright")})
+    file_name, repo_name = make_seed_jsonl(
+        get_seed(),
+        language="en",
+        name="test",
+        skip_lines_set=skip_lines_set,
+        min_chars=32,
+        gzipped=gzipped,
+    )
+    assert repo_name == "lm_en_pseudocrawl_test"
+    assert file_name == "lm_en_pseudocrawl_test.jsonl." + ("gz" if gzipped else "zst")
+    lines = read_lines(file_name)
+    assert len(lines) == 100
+    # both formats are written as plain UTF-8 without escaped slashes
+    assert b"https://example.com/0" in lines[0]
+    assert "café".encode() in lines[0]
+    assert orjson.loads(lines[0]) == {
+        "meta": {
+            "url": "https://example.com/0",
+            "content_languages": "en",
+            "seed_id": 1,
+        },
+        "text": "Page 0 has enough words to be kept in the seed, café",
+    }
+
+
+def test_load_or_get_lines_to_skip(tmp_path, monkeypatch):
+    shard_files = []
+    for i in range(2):
+        shard = tmp_path / f"shard_{i}.jsonl.gz"
+        shard.write_bytes(b"shard")
+        shard_files.append(str(shard))
+    cache_file = str(tmp_path / "cache" / "skip_lines.json.zst")
+    get_lines_to_skip = pseudo_crawl_seed_to_lm_dset.get_lines_to_skip
+    calls = []
+
+    def counting_get_lines_to_skip(dset):
+        calls.append(dset)
+        return get_lines_to_skip(dset)
+
+    monkeypatch.setattr(
+        pseudo_crawl_seed_to_lm_dset, "get_lines_to_skip", counting_get_lines_to_skip
+    )
+    seed = get_seed(num_pages=1000)
+    skip_lines_set = load_or_get_lines_to_skip(seed, cache_file, shard_files)
+    assert skip_lines_set == {hash_line("Menu"), hash_line("Copyright")}
+    assert len(calls) == 1
+
+    # the second run reuses the lines saved by the first one
+    assert load_or_get_lines_to_skip(seed, cache_file, shard_files) == skip_lines_set
+    assert len(calls) == 1
+
+    # a shard modified since invalidates them
+    stat = os.stat(shard_files[1])
+    os.utime(shard_files[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert load_or_get_lines_to_skip(seed, cache_file, shard_files) == skip_lines_set
+    assert len(calls) == 2
+
+    # and so do other parameters
+    monkeypatch.setitem(pseudo_crawl_seed_to_lm_dset._SKIP_LINES_PARAMS, "min_count", 5)
+    load_or_get_lines_to_skip(seed, cache_file, shard_files)
+    assert len(calls) == 3
+    load_or_get_lines_to_skip(seed, cache_file, shard_files[:1])
+    assert len(calls) == 4
@@ -31,14 +31,18 @@ def requirements(filename="requirements.txt"):
         return [line.strip() for line in f if line and line[0] != "#"]
 
 
+# Markdown link definitions and link references
+MD_LINK_DEF = re.compile(r"^\[ ([^\]]+) \]: \s+ \S.*\n", flags=re.X | re.M)
+MD_LINK_REF = re.compile(r"\[ ([^\]]+) \]", flags=re.X)
+
+
 def long_description():
     """
     Take the README and remove markdown hyperlinks
     """
     with open("README.md", "rt", encoding="utf-8") as f:
-        desc = f.read()
-        desc = re.sub(r"^\[ ([^\]]+) \]: \s+ \S.*\n", r"", desc, flags=re.X | re.M)
-        return re.sub(r"\[ ([^\]]+) \]", r"\1", desc, flags=re.X)
+        desc = MD_LINK_DEF.sub(r"", f.read())
+        return MD_LINK_REF.sub(r"\1", desc)
 
 
 # --------------------------------------------------------------------